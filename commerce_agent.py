@@ -6,18 +6,113 @@ import re
 import sys
 from dotenv import load_dotenv
 
+from json_utils import extract_json as _extract_json
+
 # --- DroidRun Professional Architecture Imports ---
 try:
     from droidrun.agent.droid import DroidAgent
-    from droidrun.config_manager import DroidrunConfig
+    from droidrun.agent.utils.llm_picker import load_llm
+    from droidrun.config_manager import DroidrunConfig, AgentConfig, ManagerConfig, ExecutorConfig, TelemetryConfig
 except ImportError:
     print("CRITICAL ERROR: 'droidrun' library not found or incompatible version.")
     print("Please ensure you have installed it: pip install droidrun")
     sys.exit(1)
 
+# Fast JSON path (Rust-based orjson), falling back to stdlib for portability
+try:
+    import orjson
+
+    def _loads(s):
+        return orjson.loads(s)
+
+    def _dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+
+    def _print_json(obj):
+        # Raw bytes straight to stdout: one write, no text codec or
+        # newline translation on the (potentially large) result dump
+        sys.stdout.buffer.write(
+            orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        )
+        sys.stdout.buffer.flush()
+except ImportError:
+    orjson = None
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj, indent=2, default=str)
+
+    def _print_json(obj):
+        print(_dumps(obj))
+
 # Load environment variables
 load_dotenv()
 
+# Resolved once at import; every agent setup reuses this instead of
+# re-reading os.environ per call
+_API_KEY = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+
+# Compiled once at import - shared by every price parse
+_NUM_RE = re.compile(r'\d+(?:\.\d+)?')
+
+# Single-pass removal of currency/separator noise ('rs' tokens handled separately)
+_PRICE_TRANS = str.maketrans('', '', ',₹ \t\n')
+
+# Goal templates assembled once at import; execute_task only interpolates
+# the per-call variables instead of re-joining the literal fragments
+_ORDER_GOAL = (
+    "Open the app '{app}'. "
+    "Search for '{query}'. "
+    "Wait for results. "
+    "Visually SCAN and {item_instruction}. "
+    "Click 'Add' or 'Add to Cart'. "
+    "Go to View Cart. "
+    "Click 'Proceed to Pay' or 'Checkout'. "
+    "Select 'Cash on Delivery' (COD) or 'Pay on Delivery'. "
+    "CRITICAL: Click 'Place Order', 'Confirm Order', or 'Swipe to Pay' to finalize the booking. "
+    "Return a strict JSON object with keys: 'status' (success/failed), 'order_id', 'final_price'. "
+)
+_SEARCH_GOAL = (
+    "Open the app '{app}'. "
+    "Search for '{query}'. "
+    "Wait for the search results to load. "
+    "Visually SCAN the search results. "
+    "Identify multiple items matching '{query}'. "
+    "COMPARE their prices and Select the CHEAPEST option. "
+    "Extract the following details for the CHEAPEST item: "
+    "1. Product Name (title) "
+    "2. Price (numeric value) "
+    "3. Rating "
+    "4. Restaurant Name "
+    "Return a strict JSON object with keys: 'title', 'price', 'rating', 'restaurant'. "
+    "If no exact match is found, find the closest match. "
+)
+
+async def _wait_device_idle(timeout: float = 3.0, poll: float = 0.1):
+    """Event-driven replacement for fixed app-switch cooldowns.
+
+    Polls ADB for the foreground window and returns as soon as the
+    launcher/system UI is in front, with `timeout` as the hard cap. Usually
+    returns in a few hundred ms instead of a multi-second sleep.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        try:
+            proc = await asyncio.create_subprocess_shell(
+                "adb shell dumpsys window | grep -m1 mCurrentFocus",
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            out, _ = await proc.communicate()
+            focus = out.decode('utf-8', 'replace').lower()
+            if 'launcher' in focus or 'systemui' in focus:
+                return
+        except OSError:
+            return  # No ADB available; don't block the pipeline
+        await asyncio.sleep(poll)
+
+
 class CommerceAgent:
     """
     Professional Commerce Agent using DroidRun Framework.
@@ -29,20 +124,42 @@ class CommerceAgent:
         self.model = model
         self._ensure_api_keys()
 
+        # Build the LLM client and agent config once; both are reused for
+        # every platform task instead of being reconstructed per call.
+        self._llm = load_llm(
+            provider_name="GoogleGenAI",
+            model=self.model,
+            api_key=_API_KEY
+        )
+
+        # Enable vision for Manager (planning) and Executor (acting);
+        # telemetry stays off to avoid "multiple values for distinct_id" error
+        self._config = DroidrunConfig(
+            agent=AgentConfig(
+                reasoning=True,
+                manager=ManagerConfig(vision=True),
+                executor=ExecutorConfig(vision=True)
+            ),
+            telemetry=TelemetryConfig(enabled=False)
+        )
+
     def _ensure_api_keys(self):
-        if self.provider == "gemini" and not os.getenv("GEMINI_API_KEY") and not os.getenv("GOOGLE_API_KEY"):
-             # Fallback check
-             print("[Warn] GEMINI_API_KEY not found in env, checking GOOGLE_API_KEY")
+        if self.provider == "gemini" and not _API_KEY:
+             print("[Warn] Neither GEMINI_API_KEY nor GOOGLE_API_KEY found in env")
 
     def _parse_price(self, price_str):
         """Robust price parsing utility."""
         if not price_str: return float('inf')
+        if not isinstance(price_str, str):
+            price_str = str(price_str)
         try:
-            raw = str(price_str).strip()
+            raw = price_str.strip()
             # print(f"[DEBUG] Parsing Price Raw: '{raw}'") # User requested investigation of mismatched logs
             
-            clean = raw.lower().replace(',', '').replace('₹', '').replace('rs', '').replace('rs.', '').strip()
-            match = re.search(r'\d+(\.\d+)?', clean)
+            # One translate pass for the single-char noise, then the multichar
+            # 'rs.' token before 'rs' so no dangling dot is left behind
+            clean = raw.lower().translate(_PRICE_TRANS).replace('rs.', '').replace('rs', '')
+            match = _NUM_RE.search(clean)
             
             if match:
                  val = float(match.group())
@@ -51,7 +168,7 @@ class CommerceAgent:
             else:
                  print(f"[Warn] Could not extract number from price string: '{raw}'")
                  return float('inf')
-        except Exception as e:
+        except (AttributeError, ValueError, TypeError) as e:
             print(f"[Error] Price Parse Failed for '{price_str}': {e}")
             return float('inf')
 
@@ -62,70 +179,22 @@ class CommerceAgent:
         Action: 'search' (compare prices) or 'order' (buy item via COD).
         """
         print(f"\n[CommerceAgent] Initializing Task for: {app_name} (Action: {action})")
-        
+
+        # Bind hot attributes as locals once; the concurrently scheduled
+        # per-platform coroutines then avoid repeated self.__dict__ walks
+        llm, config, parse_price = self._llm, self._config, self._parse_price
+
+
         # 1. Define Goal (Natural Language with Structural Constraints)
         if action == "order":
             item_instruction = f"find the item '{target_item}'" if target_item else "Select the first relevant item"
-            goal = (
-                f"Open the app '{app_name}'. "
-                f"Search for '{query}'. "
-                f"Wait for results. "
-                f"Visually SCAN and {item_instruction}. "
-                f"Click 'Add' or 'Add to Cart'. "
-                f"Go to View Cart. "
-                f"Click 'Proceed to Pay' or 'Checkout'. "
-                f"Select 'Cash on Delivery' (COD) or 'Pay on Delivery'. "
-                f"CRITICAL: Click 'Place Order', 'Confirm Order', or 'Swipe to Pay' to finalize the booking. "
-                f"Return a strict JSON object with keys: 'status' (success/failed), 'order_id', 'final_price'. "
-            )
+            goal = _ORDER_GOAL.format(app=app_name, query=query, item_instruction=item_instruction)
         else:
-            goal = (
-                f"Open the app '{app_name}'. "
-                f"Search for '{query}'. "
-                f"Wait for the search results to load. "
-                f"Visually SCAN the search results. "
-                f"Identify multiple items matching '{query}'. "
-                f"COMPARE their prices and Select the CHEAPEST option. "
-                f"Extract the following details for the CHEAPEST item: "
-                f"1. Product Name (title) "
-                f"2. Price (numeric value) "
-                f"3. Rating "
-                f"4. Restaurant Name "
-                f"Return a strict JSON object with keys: 'title', 'price', 'rating', 'restaurant'. "
-                f"If no exact match is found, find the closest match. "
-            )
+            goal = _SEARCH_GOAL.format(app=app_name, query=query)
 
         # 2. Configure Agent (Professional Pattern)
-        # Using load_llm to avoid DroidrunConfig error
-        from droidrun.agent.utils.llm_picker import load_llm
-        from droidrun.config_manager import DroidrunConfig, AgentConfig, ManagerConfig, ExecutorConfig, TelemetryConfig
-        
-        api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-        llm = load_llm(
-            provider_name="GoogleGenAI",
-            model=self.model,
-            api_key=api_key
-        )
-
-        # Create properly typed config
-        # Enable vision for Manager (planning) and Executor (acting)
-        manager_config = ManagerConfig(vision=True)
-        executor_config = ExecutorConfig(vision=True)
-        
-        agent_config = AgentConfig(
-            reasoning=True,
-            manager=manager_config,
-            executor=executor_config
-        )
-        
-        # Disable telemetry to avoid "multiple values for distinct_id" error
-        telemetry_config = TelemetryConfig(enabled=False)
-        
-        config = DroidrunConfig(
-            agent=agent_config,
-            telemetry=telemetry_config
-        )
-
+        # LLM client and config are cached on the instance - only the
+        # per-goal DroidAgent is built here.
         agent = DroidAgent(
             goal=goal,
             llms=llm,
@@ -137,46 +206,41 @@ class CommerceAgent:
         try:
             print(f"[CommerceAgent] 🧠 Running Agent Logic...")
             result = await agent.run()
+            # Avoid stringifying the full transcript up front; the raw text is
+            # only materialized below on the failure paths.
             print(f"[DEBUG] Raw Agent Result type: {type(result)}")
-            print(f"[DEBUG] Raw Agent Result: {result}")
-            
+
             # 4. Parse Output
             if result:
-                # Handle DroidAgent Event objects
-                if hasattr(result, 'reason'):
-                     clean_json = str(result.reason).strip()
+                # Handle DroidAgent Event objects; bytes payloads are decoded
+                # once instead of round-tripping through str() (which would
+                # produce a b'...' repr and break parsing)
+                raw = result.reason if hasattr(result, 'reason') else result
+                if isinstance(raw, (bytes, bytearray, memoryview)):
+                     clean_json = bytes(raw).decode('utf-8', 'replace').strip()
                 else:
-                     clean_json = str(result).strip()
+                     clean_json = str(raw).strip()
                 
                 print(f"[DEBUG] Processing result string: {clean_json[:100]}...")
 
-                # XML tag cleanup (common with DroidRun Reasoning)
-                if "<request_accomplished" in clean_json:
+                # Single-pass extraction of the first balanced JSON object -
+                # covers markdown fences, XML tags and surrounding chatter
+                payload = _extract_json(clean_json)
+                if payload and payload[0] == "{":
                     try:
-                        clean_json = clean_json.split(">")[1].split("</request_accomplished>")[0].strip()
-                    except IndexError:
-                        pass
-                
-                # Markdown cleanup
-                if "```json" in clean_json:
-                    clean_json = clean_json.split("```json")[1].split("```")[0].strip()
-                elif "```" in clean_json:
-                    clean_json = clean_json.split("```")[1].split("```")[0].strip()
-                
-                # Heuristic validation
-                if clean_json.startswith("{"):
-                    try:
-                         data = json.loads(clean_json)
+                         data = _loads(payload)
                          start_data["data"] = data
                          start_data["status"] = "success"
-                         start_data["data"]["numeric_price"] = self._parse_price(data.get("price"))
+                         start_data["data"]["numeric_price"] = parse_price(data.get("price"))
                          # Ensure restaurant key exists
                          if "restaurant" not in start_data["data"]:
                               start_data["data"]["restaurant"] = "Unknown"
-                    except json.JSONDecodeError:
-                         print(f"[Warn] JSON Decode Error: {clean_json}")
+                    except ValueError:
+                         print(f"[Warn] JSON Decode Error: {payload}")
+                         start_data["raw_response"] = clean_json
                 else:
                      print(f"[Warn] Agent output was not JSON: {clean_json[:50]}...")
+                     start_data["raw_response"] = clean_json
             else:
                  print("[Warn] Agent returned None result.")
             
@@ -192,52 +256,41 @@ class CommerceAgent:
         """
         print(f"\n[CommerceAgent] 🤖 Autonomous Ordering Sequence Initiated for: '{query}'")
         
-        # 1. Compare Prices
+        # 1. Compare Prices (both searches are independent I/O-bound agent runs, so overlap them)
         platforms = ["Zomato", "Swiggy"]
+        search_tasks = [self.execute_task(p, query, "food item", action="search") for p in platforms]
+        done = await asyncio.gather(*search_tasks, return_exceptions=True)
+
         results = {}
-        
-        for platform in platforms:
-            res = await self.execute_task(platform, query, "food item", action="search")
+        for platform, res in zip(platforms, done):
+            if isinstance(res, Exception):
+                print(f"[Error] Search crashed on {platform}: {res}")
+                res = {"platform": platform, "status": "failed", "data": {}}
             results[platform.lower()] = res
-            await asyncio.sleep(2)
 
-        # 2. Determine Victor
-        z_price = float('inf')
-        s_price = float('inf')
-        
-        if results.get('zomato', {}).get('status') == 'success':
-            z_price = results['zomato']['data'].get('numeric_price', float('inf'))
-            
-        if results.get('swiggy', {}).get('status') == 'success':
-             s_price = results['swiggy']['data'].get('numeric_price', float('inf'))
-             
-        victor = None
-        target_app = None
-        target_title = None
-        
-        if z_price < s_price:
-            victor = results['zomato']
-            target_app = "Zomato"
-            target_title = victor['data'].get('title')
-        elif s_price < z_price:
-             victor = results['swiggy']
-             target_app = "Swiggy"
-             target_title = victor['data'].get('title')
-        elif s_price == z_price and s_price != float('inf'):
-             target_app = "Swiggy" # Default to Swiggy on tie
-             victor = results['swiggy']
-             target_title = victor['data'].get('title')
-        
-        if not target_app:
+        # 2. Determine Victor - single min() pass over (price, app, result) tuples.
+        # Swiggy comes first so a price tie keeps the historical Swiggy default.
+        inf = float('inf')
+        cands = [
+            (res['data'].get('numeric_price', inf) if res.get('status') == 'success' else inf, app, res)
+            for app, res in (("Swiggy", results.get('swiggy', {})), ("Zomato", results.get('zomato', {})))
+        ]
+        best_price, target_app, victor = min(cands, key=lambda c: c[0])
+
+        if best_price == inf:
              print("\n❌ Could not determine valid pricing on either app. Aborting order.")
              return results
 
+        target_title = victor['data'].get('title')
+
         print(f"\n[CommerceAgent] 🏆 Best Deal identify: {target_app} @ {victor['data'].get('price')}")
         print(f"Details: {target_title}")
         print(f"Proceeding to ORDER on {target_app}...")
         
         # 3. Order
-        # We perform the order action on the winning app with specific target
+        # Wait for the device to settle after the search sessions, then
+        # perform the order action on the winning app with specific target
+        await _wait_device_idle()
         booking_result = await self.execute_task(target_app, query, "food item", action="order", target_item=target_title)
         
         results["order_status"] = booking_result
@@ -270,14 +323,20 @@ async def main():
         if args.app:
             platforms = [p for p in platforms if p.lower() == args.app.lower()]
 
+        # Run all platform tasks concurrently - each is an independent agent session
+        tasks = [commerce_bot.execute_task(p, args.query, item_type, action=args.action) for p in platforms]
+        done = await asyncio.gather(*tasks, return_exceptions=True)
+
         results = {}
-        for platform in platforms:
-            res = await commerce_bot.execute_task(platform, args.query, item_type, action=args.action)
+        for platform, res in zip(platforms, done):
+            if isinstance(res, Exception):
+                print(f"[Error] Task crashed on {platform}: {res}")
+                res = {"platform": platform, "status": "failed", "data": {}}
             results[platform.lower()] = res
-            await asyncio.sleep(2)
-            
+
+
         print("\n--- Final Results ---")
-        print(json.dumps(results, indent=2))
+        _print_json(results)
 
 if __name__ == "__main__":
     if sys.platform == 'win32':
@@ -0,0 +1,146 @@
+"""Shared base for the app-comparison agents (pharmacy, rides).
+
+PharmacyAgent and RideComparisonAgent carried near-identical copies of the
+API-key check, price parsing, LLM/config caching, transient-error retry and
+agent-output parsing. That scaffolding lives here once; subclasses only
+build goals and aggregate results, so fixes and optimizations to the shared
+path apply to every comparison agent at the same time.
+"""
+
+import asyncio
+import os
+import random
+import re
+
+from json_utils import parse_llm_json
+
+# --- DroidRun Professional Architecture Imports ---
+try:
+    from droidrun.agent.droid import DroidAgent
+    from droidrun.agent.utils.llm_picker import load_llm
+    from droidrun.config_manager import DroidrunConfig, AgentConfig, ManagerConfig, ExecutorConfig, TelemetryConfig
+except ImportError:
+    import sys
+    print("CRITICAL ERROR: 'droidrun' library not found or incompatible version.")
+    print("Please ensure you have installed it: pip install droidrun")
+    sys.exit(1)
+
+# Compiled once at import - shared by every price parse
+_PRICE_RE = re.compile(r'\d+(?:\.\d+)?')
+
+# Single-pass removal of currency/separator noise ('rs' tokens handled separately)
+_PRICE_TRANS = str.maketrans('', '', ',₹ \t\n')
+
+
+class AppComparisonAgent:
+    """Common scaffolding for agents that compare prices across apps."""
+
+    default_model = "gemini-1.5-flash"
+
+    def __init__(self, provider="gemini", model=None):
+        self.provider = provider
+        self.model = model or self.default_model
+        self._llm = None
+        self._config = None
+        self._ensure_api_keys()
+
+    def _ensure_api_keys(self):
+        if self.provider == "gemini" and not os.getenv("GEMINI_API_KEY") and not os.getenv("GOOGLE_API_KEY"):
+             print("[Warn] GEMINI_API_KEY not found in env, checking GOOGLE_API_KEY")
+
+    def _parse_price(self, price_str):
+        """Robust price parsing utility handling currency symbols."""
+        if not price_str: return float('inf')
+        try:
+            # One translate pass for single-char noise, then 'rs.' before
+            # 'rs' so no dangling dot is left behind
+            clean = str(price_str).lower().translate(_PRICE_TRANS).replace('rs.', '').replace('rs', '')
+            match = _PRICE_RE.search(clean)
+            return float(match.group()) if match else float('inf')
+        except (AttributeError, ValueError, TypeError):
+            return float('inf')
+
+    def _agent_setup(self):
+        """Build the LLM client and agent config once and reuse them.
+
+        The client init opens auth/session resources, so paying it per
+        app call was pure overhead.
+        """
+        if self._llm is None:
+            provider_name = "GoogleGenAI" if self.provider == "gemini" else self.provider
+            api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+            self._llm = load_llm(
+                provider_name=provider_name,
+                model=self.model,
+                api_key=api_key
+            )
+            self._config = DroidrunConfig(
+                agent=AgentConfig(
+                    reasoning=True,
+                    manager=ManagerConfig(vision=True),
+                    executor=ExecutorConfig(vision=True)
+                ),
+                telemetry=TelemetryConfig(enabled=False)
+            )
+        return self._llm, self._config
+
+    async def _run_with_retry(self, agent, attempts=3):
+        """Run the agent, retrying transient rate-limit/network failures.
+
+        Only 429/quota/connection-style errors are retried, with
+        exponential backoff plus jitter; deterministic failures surface
+        immediately so they are not paid for three times.
+        """
+        for i in range(attempts):
+            try:
+                return await agent.run()
+            except Exception as e:
+                msg = str(e)
+                transient = (
+                    "429" in msg or "503" in msg or "ResourceExhausted" in msg
+                    or "quota" in msg.lower() or "timeout" in msg.lower()
+                    or "connection" in msg.lower()
+                )
+                if not transient or i == attempts - 1:
+                    raise
+                wait = 2 ** i + random.random()
+                print(f"[Warn] Transient agent error ({e}); retrying in {wait:.1f}s...")
+                await asyncio.sleep(wait)
+
+    async def _run_goal(self, goal: str, result_data: dict, price_key: str = "price") -> dict:
+        """Run a DroidAgent for a goal and fill result_data from its output.
+
+        result_data is mutated in place: on a parsable JSON response the
+        'data', 'status' and 'numeric_price' keys are set; otherwise it is
+        returned unchanged (still in its caller-provided failed shape).
+        """
+        llm, config = self._agent_setup()
+
+        agent = DroidAgent(
+            goal=goal,
+            llms=llm,
+            config=config
+        )
+
+        result = await self._run_with_retry(agent)
+
+        # --- Robust Output Parsing ---
+        if result:
+            if hasattr(result, 'reason'):
+                 clean_json = str(result.reason).strip()
+            elif hasattr(result, 'message'):
+                 clean_json = str(result.message).strip()
+            else:
+                 clean_json = str(result).strip()
+
+            # Shared single-pass extractor handles fences, XML tags
+            # and chatter around the payload
+            data = parse_llm_json(clean_json)
+            if isinstance(data, dict):
+                result_data["data"] = data
+                result_data["status"] = "success"
+                result_data["numeric_price"] = self._parse_price(data.get(price_key))
+            else:
+                 print(f"[Warn] Agent output was not JSON: {clean_json[:50]}...")
+
+        return result_data
@@ -275,6 +275,9 @@ document.addEventListener('DOMContentLoaded', () => {
     function connectWebSocket() {
         // Use relative path or hardcoded local
         const ws = new WebSocket('ws://localhost:8000/ws');
+        // Server broadcasts binary (orjson) frames
+        ws.binaryType = 'arraybuffer';
+        const wsDecoder = new TextDecoder();
 
         ws.onopen = () => {
             connectionStatus.textContent = 'Live Uplink';
@@ -284,7 +287,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
         ws.onmessage = (event) => {
             try {
-                const data = JSON.parse(event.data);
+                const raw = event.data instanceof ArrayBuffer ? wsDecoder.decode(event.data) : event.data;
+                const data = JSON.parse(raw);
                 handleWsMessage(data);
             } catch (e) {
                 // Ignore raw strings if any
@@ -300,7 +304,7 @@ document.addEventListener('DOMContentLoaded', () => {
         };
     }
 
-    function handleWsMessage(payload) {
+    function handleWsMessageSingle(payload) {
         const { type, task_id, message, status, result, persona } = payload;
 
         // Ensure task exists in local state
@@ -340,6 +344,20 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    function handleWsMessage(payload) {
+        // Heartbeat frames just keep the connection healthy
+        if (payload.type === 'ping') return;
+        // Server coalesces log lines into batch frames; unpack and reuse
+        // the single-message handler for each entry
+        if (payload.type === 'log_batch') {
+            for (const item of payload.items) {
+                handleWsMessageSingle({ type: 'log', task_id: item.task_id, message: item.message });
+            }
+            return;
+        }
+        handleWsMessageSingle(payload);
+    }
+
     // --- Helpers ---
     function capitalize(str) {
         return str ? str.charAt(0).toUpperCase() + str.slice(1) : '';
@@ -0,0 +1,79 @@
+"""Shared helpers for parsing JSON out of LLM/agent output.
+
+Agent transcripts wrap their JSON payload in markdown fences, XML tags or
+plain chatter, and every consumer used to carry its own split-chain to peel
+that off. These helpers do it once: loads() prefers orjson (C parser, ~3-5x
+faster than stdlib, falls back cleanly), extract_json() finds the payload
+object in arbitrary text with O(n) scans, and parse_llm_json() combines the
+two into a best-effort parse.
+"""
+
+import json
+
+try:
+    import orjson
+
+    def loads(s):
+        return orjson.loads(s)
+except ImportError:
+    orjson = None
+    loads = json.loads
+
+
+def _balanced_spans(s, opener, closer):
+    """Yield every top-level balanced opener...closer substring of s.
+
+    Quote-aware within a span: brackets inside JSON string values (a
+    free-text "analysis" field saying 'tap the } button') do not affect
+    the depth count. Quotes outside any span are plain prose and ignored.
+    """
+    depth = 0
+    start = -1
+    in_str = False
+    escaped = False
+    for i, c in enumerate(s):
+        if in_str:
+            if escaped:
+                escaped = False
+            elif c == '\\':
+                escaped = True
+            elif c == '"':
+                in_str = False
+        elif c == '"' and depth:
+            in_str = True
+        elif c == opener:
+            if depth == 0:
+                start = i
+            depth += 1
+        elif c == closer and depth:
+            depth -= 1
+            if depth == 0:
+                yield s[start:i + 1]
+
+
+def extract_json(s):
+    """Return the first balanced {...} substring of s, else [...], else None.
+
+    Objects are preferred over arrays so chatter like "Steps: [1] ..."
+    ahead of the payload does not shadow it; the scan tolerates markdown
+    fences, XML tags and LLM prose around the blob.
+    """
+    for opener, closer in (('{', '}'), ('[', ']')):
+        for blob in _balanced_spans(s, opener, closer):
+            return blob
+    return None
+
+
+def parse_llm_json(text):
+    """Best-effort parse of an LLM response into a dict/list, or None.
+
+    Candidate blobs that fail to decode (bracketed prose, step markers)
+    are skipped so a decoy ahead of the real payload does not mask it.
+    """
+    for opener, closer in (('{', '}'), ('[', ']')):
+        for blob in _balanced_spans(text, opener, closer):
+            try:
+                return loads(blob)
+            except ValueError:
+                continue
+    return None
@@ -1,13 +1,15 @@
-import os
-import time
+import io
+import re
 import asyncio
-import json
-import base64
+import socket
+import subprocess
 from typing import List, Dict, Any, Optional
 
 import google.generativeai as genai
 from PIL import Image
 
+from json_utils import parse_llm_json
+
 try:
     from droidrun.agent.droid import DroidAgent
     from droidrun.tools import AdbTools
@@ -29,10 +31,60 @@ class NeuroOrchestrator:
         
         self.device_serial = None
         self.tools = None
-        self.width = 1080 
+        self._llm = None  # Executor LLM client, built once in connect()
+        self._shell = None  # Persistent `adb shell` session (opened in connect)
+        self._minicap = None  # Optional minicap frame socket (opened in connect)
+        self.width = 1080
         self.height = 2400
+        self.density = None
+        self.sdk = None
         self.step_limit = 15
-        self.history: List[Dict] = []
+        self.history: List[str] = []  # Short rendered actions, e.g. tap@[y,x,y,x]
+        self._plan_cache: Dict = {}  # (goal, frame dHash) -> last plan
+
+        # Static planner instructions built once and sent as their own
+        # content part, so only the small state line varies per step and
+        # Gemini can context-cache the constant prefix
+        self._prompt_prefix = (
+            "You are an advanced Android Automation Brain.\n"
+            "Analyze the screenshot. The device resolution is implied 1000x1000 relative for coordinates.\n"
+            "Identify the NEXT single action.\n"
+            "- If the keyboard is open and blocking the view, use \"back\" to close it ONLY if you are NOT currently typing/searching.\n"
+            "- If you are searching, DO NOT use \"back\" as it might exit the search. Instead, proceed to tap the result IF VISIBLE.\n"
+            "- If the desired item (like 'Fries' image) is ALREADY visible, prefer 'tap' over 'type'.\n"
+            "\n"
+            "Output valid JSON only:\n"
+            "{\n"
+            '    "analysis": "Thinking process...",\n'
+            '    "status": "continue" | "done" | "failed",\n'
+            '    "action": {\n'
+            '        "type": "tap" | "type" | "key" | "wait" | "back" | "home" | "done",\n'
+            "        \"bq_box\": [ymin, xmin, ymax, xmax] (0-1000 scale) - REQUIRED for 'tap', OPTIONAL for 'type' (to tap first),\n"
+            "        \"text\": \"...\" (REQUIRED for 'type'),\n"
+            "        \"keycode\": \"...\" (OPTIONAL for 'key'),\n"
+            "        \"data\": {...} (REQUIRED if status='done', extracted info)\n"
+            "    }\n"
+            "}\n"
+        )
+
+    def _close_transports(self):
+        """Tear down the persistent shell and minicap socket.
+
+        Called on connect() failure paths so an aborted connect does not
+        leak a child process or an open forward socket.
+        """
+        if self._shell is not None:
+            try:
+                self._shell.terminate()
+            except OSError:
+                pass
+            self._shell = None
+        if self._minicap is not None:
+            try:
+                self._minicap.close()
+            except OSError:
+                pass
+            self._minicap = None
 
     async def connect(self):
         """Connect to device and initialize tools"""
@@ -44,105 +96,303 @@ class NeuroOrchestrator:
                 return False
             self.device_serial = devices[0].serial
             print(f"NeuroOrchestrator: Connected to {self.device_serial}")
+            # Tools (ADB socket) and the executor LLM client are pooled here;
+            # every sub-task reuses them instead of paying a reconnect plus
+            # client handshake per invocation
             self.tools = AdbTools(serial=self.device_serial)
-            
-            # Get Resolution
+            self._llm = load_llm(
+                provider_name="GoogleGenAI",
+                model="models/gemini-2.0-flash",
+                api_key=self.api_key
+            )
+
+            # One long-lived `adb shell`; input events write to its stdin
+            # instead of paying a fresh adb connect/handshake per action
             try:
-                # Direct ADB call to get size
-                stream = os.popen(f"adb -s {self.device_serial} shell wm size")
-                out = stream.read().strip() # e.g., Physical size: 1080x2400
-                if "size:" in out:
-                    res = out.split("size:")[1].strip().split("x")
-                    self.width = int(res[0])
-                    self.height = int(res[1])
-                    print(f"Detected Resolution: {self.width}x{self.height}")
+                self._shell = subprocess.Popen(
+                    ["adb", "-s", self.device_serial, "shell"],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    bufsize=0,
+                    text=True,
+                )
+            except OSError as e:
+                print(f"NeuroOrchestrator: persistent shell unavailable ({e})")
+                self._shell = None
+
+            # Optional high-rate capture path: if a minicap service is running
+            # on the device, attach to its socket and pull JPEG frames from it
+            # instead of paying a PNG encode per screencap. screencap remains
+            # the fallback when minicap is absent.
+            try:
+                subprocess.run(
+                    ["adb", "-s", self.device_serial, "forward", "tcp:1313", "localabstract:minicap"],
+                    check=True, capture_output=True, timeout=5,
+                )
+                sock = socket.create_connection(("127.0.0.1", 1313), timeout=1)
+                banner = sock.recv(24)  # global header (version/size/pid/resolution)
+                if len(banner) == 24:
+                    self._minicap = sock
+                    print("NeuroOrchestrator: minicap stream attached")
                 else:
-                     self.width = 1080
-                     self.height = 2400
-            except:
-                self.width = 1080
-                self.height = 2400
+                    sock.close()
+            except (OSError, subprocess.SubprocessError):
+                self._minicap = None
+
+
+            # Get Resolution + density + SDK in one shell round-trip.
+            # No silent 1080x2400 fallback: a guessed resolution on a 2k or
+            # foldable device lands ~50% of taps off-target, and every bad
+            # tap costs extra planner round-trips. Better to fail loudly.
+            try:
+                out = subprocess.check_output(
+                    ["adb", "-s", self.device_serial, "shell",
+                     "wm size; wm density; getprop ro.build.version.sdk"],
+                    text=True, timeout=10,
+                )
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f"NeuroOrchestrator: resolution probe failed ({e})")
+                self._close_transports()
+                return False
+            size_m = re.search(r"size:\s*(\d+)x(\d+)", out)
+            if not size_m:
+                print(f"NeuroOrchestrator: could not parse 'wm size' output: {out!r}")
+                self._close_transports()
+                return False
+            self.width = int(size_m.group(1))
+            self.height = int(size_m.group(2))
+            print(f"Detected Resolution: {self.width}x{self.height}")
+            density_m = re.search(r"density:\s*(\d+)", out)
+            self.density = int(density_m.group(1)) if density_m else None
+            sdk_m = re.search(r"(\d+)\s*$", out)
+            self.sdk = int(sdk_m.group(1)) if sdk_m else None
             return True
         except Exception as e:
             print(f"NeuroOrchestrator Connection Error: {e}")
+            self._close_transports()
             return False
 
-    async def capture_state_image(self) -> Optional[Image.Image]:
+    def _read_minicap_frame(self) -> Optional[bytes]:
+        """Read the next JPEG frame (4-byte LE length prefix) from minicap.
+
+        minicap only pushes frames when the screen changes, so a recv
+        timeout just means the screen is static - capture falls back to
+        screencap for that frame and the stream is kept. Only a genuine
+        stream error (EOF, short read, reset) drops the socket for the
+        rest of the mission.
+        """
+        sock = self._minicap
         try:
-            path = f"neuro_state_{int(time.time())}.png"
-            os.system(f"adb -s {self.device_serial} shell screencap -p /sdcard/neuro_cap.png")
-            os.system(f"adb -s {self.device_serial} pull /sdcard/neuro_cap.png {path}")
-            
-            if os.path.exists(path):
-                img = Image.open(path)
-                return img
+            header = sock.recv(4, socket.MSG_WAITALL)
+        except socket.timeout:
+            # Nothing consumed yet - safe to retry this socket next frame
+            return None
+        except OSError as e:
+            print(f"minicap frame read failed ({e}); falling back to screencap")
+            self._minicap = None
             return None
+        try:
+            if len(header) < 4:
+                raise OSError("minicap stream closed")
+            size = int.from_bytes(header, "little")
+            buf = bytearray()
+            while len(buf) < size:
+                chunk = sock.recv(size - len(buf))
+                if not chunk:
+                    raise OSError("minicap stream closed")
+                buf.extend(chunk)
+            return bytes(buf)
+        except OSError as e:
+            # Includes a timeout mid-frame: the stream is desynced past the
+            # header, so it cannot be trusted for later frames either
+            print(f"minicap frame read failed ({e}); falling back to screencap")
+            self._minicap = None
+            return None
+
+    async def capture_state_image(self) -> Optional[bytes]:
+        """Grab the current frame as raw encoded bytes (JPEG or PNG).
+
+        Bytes are the currency between capture and planning; nothing decodes
+        a pixel buffer until the planner actually needs one.
+        """
+        if self._minicap is not None:
+            frame = await asyncio.to_thread(self._read_minicap_frame)
+            if frame:
+                return frame
+        try:
+            # Single exec-out pipe: PNG bytes stream straight to memory,
+            # no /sdcard write, no pull RPC, no host-disk round-trip
+            proc = await asyncio.create_subprocess_exec(
+                "adb", "-s", self.device_serial, "exec-out", "screencap", "-p",
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            png_bytes, _ = await proc.communicate()
+            if proc.returncode != 0 or not png_bytes:
+                print("Screenshot failed: screencap returned no data")
+                return None
+            return png_bytes
         except Exception as e:
             print(f"Screenshot failed: {e}")
             return None
 
-    def plan_next_step(self, main_goal: str, current_image: Image.Image, step_count: int) -> Dict:
+    @staticmethod
+    def _prep_vision(img: Image.Image) -> Dict:
+        """Downscale + JPEG-encode a screenshot before it hits Gemini.
+
+        The planner already works on a 0-1000 normalized coordinate scale,
+        so resizing does not affect tap mapping - it just cuts vision tokens,
+        upload size and rate-limit pressure.
         """
-        Uses Vision to output exact COORDINATES or TEXT args.
+        img = img.convert("RGB")
+        img.thumbnail((768, 768), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=80)
+        return {"mime_type": "image/jpeg", "data": buf.getvalue()}
+
+    @staticmethod
+    def _dhash(img: Image.Image) -> int:
+        """64-bit difference hash of a frame (~50us); identical screens
+        collapse to the same int."""
+        small = img.convert("L").resize((9, 8), Image.BILINEAR)
+        px = list(small.getdata())
+        bits = 0
+        for row in range(8):
+            base = row * 9
+            for col in range(8):
+                bits = (bits << 1) | (px[base + col] > px[base + col + 1])
+        return bits
+
+    @classmethod
+    def _dhash_bytes(cls, frame: bytes) -> int:
+        """dHash of an encoded frame (decodes just for the 9x8 thumbnail)."""
+        return cls._dhash(Image.open(io.BytesIO(frame)))
+
+    async def plan_next_step(self, main_goal: str, image_bytes: bytes, step_count: int) -> Dict:
         """
-        prompt = f"""
-        You are an advanced Android Automation Brain.
-        Main Goal: {main_goal}
-        Step: {step_count}/{self.step_limit}
-        History: {[h['action'] for h in self.history]}
-
-        Analyze the screenshot. The device resolution is implied 1000x1000 relative for coordinates.
-        Identify the NEXT single action.
-        - If the keyboard is open and blocking the view, use "back" to close it ONLY if you are NOT currently typing/searching.
-        - If you are searching, DO NOT use "back" as it might exit the search. Instead, proceed to tap the result IF VISIBLE.
-        - If the desired item (like 'Fries' image) is ALREADY visible, prefer 'tap' over 'type'.
-        
-        Output valid JSON only:
-        {{
-            "analysis": "Thinking process...",
-            "status": "continue" | "done" | "failed",
-            "action": {{
-                "type": "tap" | "type" | "key" | "wait" | "back" | "home" | "done",
-                "bq_box": [ymin, xmin, ymax, xmax] (0-1000 scale) - REQUIRED for 'tap', OPTIONAL for 'type' (to tap first),
-                "text": "..." (REQUIRED for 'type'),
-                "keycode": "..." (OPTIONAL for 'key'),
-                "data": {{...}} (REQUIRED if status='done', extracted info)
-            }}
-        }}
+        Uses Vision to output exact COORDINATES or TEXT args.
         """
-        
+        # Only the per-step state is formatted here; the instruction block
+        # lives on self._prompt_prefix
+        state_line = (
+            f"Main Goal: {main_goal}\n"
+            f"Step: {step_count}/{self.step_limit}\n"
+            f"History: {self.history[-6:]}"
+        )
+
+        # The raw frame bytes are decoded exactly once here - hashing and
+        # the vision downscale share this pixel buffer, and no PIL object
+        # exists anywhere else on the hot path
+        current_image = Image.open(io.BytesIO(image_bytes))
+
+        # Visually identical frames (loading spinners, keyboard animations)
+        # reuse the previous plan instead of another Gemini round-trip
+        cache_key = (main_goal, self._dhash(current_image))
+        cached = self._plan_cache.get(cache_key)
+        if cached is not None:
+            print("  [Plan] Screen unchanged - reusing cached plan")
+            return cached
+
+        image_part = self._prep_vision(current_image)
+
         max_retries = 3
         for attempt in range(max_retries):
             try:
                 # Add delay to respect rate limits
                 if attempt > 0:
-                    time.sleep(2) 
-                
-                response = self.planner_model.generate_content([prompt, current_image])
-                text = response.text.strip()
-                if "```json" in text:
-                    text = text.split("```json")[1].split("```")[0]
-                elif "```" in text:
-                    text = text.split("```")[1].split("```")[0]
-                return json.loads(text)
+                    await asyncio.sleep(2)
+
+                # The SDK call is blocking - push it to a worker thread so
+                # the event loop stays free for concurrent capture/telemetry
+                response = await asyncio.to_thread(
+                    self.planner_model.generate_content,
+                    [self._prompt_prefix, state_line, image_part]
+                )
+                # Shared single-pass extractor handles fences/tags/chatter
+                plan = parse_llm_json(response.text)
+                if plan is None:
+                    raise ValueError(f"Planner output was not JSON: {response.text[:80]}")
+                if len(self._plan_cache) > 64:
+                    self._plan_cache.clear()
+                self._plan_cache[cache_key] = plan
+                return plan
             except Exception as e:
                 print(f"Planning Error (Attempt {attempt+1}): {e}")
                 if "429" in str(e) or "ResourceExhausted" in str(e) or "quota" in str(e).lower():
                     wait_time = (attempt + 1) * 5
                     print(f"Quota hit. Waiting {wait_time}s...")
-                    time.sleep(wait_time)
+                    await asyncio.sleep(wait_time)
                 else:
                     break
         
         return {"status": "failed", "analysis": "Failed after retries", "action": {"type": "wait"}}
 
+    async def _shell_exec(self, cmd: str):
+        """Run a device shell command through the persistent session.
+
+        Falls back to a one-shot async `adb shell` subprocess if the session
+        was never opened or has died; neither path blocks the event loop.
+        """
+        shell = self._shell
+        if shell and shell.poll() is None:
+            try:
+                shell.stdin.write(cmd + "\n")
+                shell.stdin.flush()
+                return
+            except (OSError, BrokenPipeError):
+                self._shell = None
+        proc = await asyncio.create_subprocess_exec(
+            "adb", "-s", self.device_serial, "shell", cmd,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        await proc.wait()
+
+    @staticmethod
+    def _render_action(action: Dict) -> str:
+        """Compact one-line rendering of an action for prompt history."""
+        tipo = action.get('type', '?')
+        if tipo == 'tap':
+            box = action.get('bq_box')
+            return f"tap@{box}" if box else "tap"
+        if tipo == 'type':
+            return f"type:\"{action.get('text', '')[:40]}\""
+        if tipo == 'key':
+            return f"key:{action.get('keycode', '')}"
+        return tipo
+
+    @staticmethod
+    def _escape_input_text(text: str) -> str:
+        """Escape text for `adb shell input text`.
+
+        The device shell parses the command line, so metacharacters in
+        LLM-provided strings (quotes, &, ;, parens in item names) must be
+        backslash-escaped or they break the command - or worse, chain into
+        it. Whitespace uses the input tool's %s encoding: a raw newline
+        written to the persistent shell's stdin would terminate the command
+        and run the rest as a new one, and a tab splits the argument.
+        Remaining control characters cannot be typed and are dropped.
+        """
+        out = []
+        for c in text:
+            if c in ' \t\n\r':
+                out.append('%s')
+            elif c < ' ' or c == '\x7f':
+                continue
+            elif c in '\\&()<>|;*~"\'`$!#':
+                out.append('\\' + c)
+            else:
+                out.append(c)
+        return ''.join(out)
+
     async def execute_action_direct(self, action: Dict):
         """
         Executes action directly via ADB.
         """
         tipo = action.get('type')
         print(f"  [Act] Executing: {tipo} | {action}")
-        
+
         if tipo == 'tap':
             box = action.get('bq_box')
             if box:
@@ -150,40 +400,36 @@ class NeuroOrchestrator:
                 ymin, xmin, ymax, xmax = box
                 cx = (xmin + xmax) / 2 / 1000 * self.width
                 cy = (ymin + ymax) / 2 / 1000 * self.height
-                cmd = f"adb -s {self.device_serial} shell input tap {int(cx)} {int(cy)}"
-                os.system(cmd)
+                await self._shell_exec(f"input tap {int(cx)} {int(cy)}")
                 return "Tapped"
-                
+
         elif tipo == 'type':
             text = action.get('text', '')
-            
+
             # Standard input text is most compatible with standard keyboards
-            # We escape spaces
-            clean_text = text.replace(" ", "%s")
-            os.system(f"adb -s {self.device_serial} shell input text {clean_text}")
-            
-            # Hit Enter to search
-            time.sleep(1.5)
-            os.system(f"adb -s {self.device_serial} shell input keyevent 66")
+            clean_text = self._escape_input_text(text)
+            # One fused device-side command: type, settle, then Enter to
+            # search - a single shell dispatch instead of two plus a host sleep
+            await self._shell_exec(f"input text {clean_text} && sleep 1.5 && input keyevent 66")
             return f"Typed {text}"
-            
+
         elif tipo == 'key':
             code = action.get('keycode', '')
-            os.system(f"adb -s {self.device_serial} shell input keyevent {code}")
+            await self._shell_exec(f"input keyevent {code}")
             return f"Key {code}"
-            
+
         elif tipo == 'back':
-            os.system(f"adb -s {self.device_serial} shell input keyevent 4")
+            await self._shell_exec("input keyevent 4")
             return "Back (Close Keyboard/Nav)"
-            
+
         elif tipo == 'home':
-            os.system(f"adb -s {self.device_serial} shell input keyevent 3")
+            await self._shell_exec("input keyevent 3")
             return "Home"
-            
+
         elif tipo == 'wait':
-            time.sleep(2)
+            await asyncio.sleep(2)
             return "Waited"
-            
+
         return "Unknown Action"
 
     async def execute_subtask(self, instruction: str):
@@ -191,22 +437,24 @@ class NeuroOrchestrator:
         Spawns a DroidAgent for a single instruction (Atomic Execution) - Legacy/Fallback
         """
         print(f"  [Executor] Running: {instruction}")
-        
-        # Load LLM for the agent (Executor)
-        llm = load_llm(
-            provider_name="GoogleGenAI", 
-            model="models/gemini-2.0-flash", 
-            api_key=self.api_key
-        )
-        
-        # We use a short max_steps because this is a sub-task
+
+        # LLM client and AdbTools are pooled on the instance by connect();
+        # build the client here only if connect() was never run so callers
+        # that skip it keep the baseline behavior
+        if self._llm is None:
+            self._llm = load_llm(
+                provider_name="GoogleGenAI",
+                model="models/gemini-2.0-flash",
+                api_key=self.api_key
+            )
+
         agent = DroidAgent(
             goal=instruction,
-            llm=llm,
+            llm=self._llm,
             tools=self.tools,
             max_steps=5, # Atomic!
             debug=True,
-            vision=False 
+            vision=False
         )
         
         handler = agent.run()
@@ -216,19 +464,60 @@ class NeuroOrchestrator:
         result = await handler
         return result
 
+    async def _settle_and_capture(self, settle: float = 2.0):
+        """Let the UI stabilize, then grab the next frame.
+
+        Scheduled as a task right after each action so the settle delay and
+        the screencap subprocess run off the critical path - the mission
+        loop picks up an already-captured frame on its next iteration.
+        """
+        await asyncio.sleep(settle)
+        return await self.capture_state_image()
+
     async def run_mission(self, goal: str):
         print(f"NeuroOrchestrator Mission (Direct Mode): {goal}")
         if not await self.connect():
             return {"status": "failed", "error": "Connection Failed"}
 
+        next_img_task = None
+        prev_hash = None
+        last_type = None
+        auto_waits = 0
         for i in range(1, self.step_limit + 1):
             print(f"\n--- Step {i}/{self.step_limit} ---")
-            
-            img = await self.capture_state_image()
-            if not img:
+
+            if next_img_task is not None:
+                frame = await next_img_task
+                next_img_task = None
+            else:
+                frame = await self.capture_state_image()
+            if not frame:
                 return {"status": "failed", "error": "Vision Lost"}
-                
-            plan = self.plan_next_step(goal, img, i)
+
+            cur_hash = self._dhash_bytes(frame)
+
+            # After a wait/type the UI is often still loading and visually
+            # identical - another planner call would just say "wait" again.
+            # Skip Gemini and wait directly, bounded to 3 in a row so a
+            # genuinely stuck screen still reaches the planner.
+            if (
+                prev_hash is not None
+                and last_type in ("wait", "type")
+                and auto_waits < 3
+                and bin(prev_hash ^ cur_hash).count("1") < 3
+            ):
+                auto_waits += 1
+                print("  [Plan] Screen still settling - waiting without planner call")
+                await self.execute_action_direct({"type": "wait"})
+                self.history.append("wait")
+                last_type = "wait"
+                prev_hash = cur_hash
+                next_img_task = asyncio.create_task(self._settle_and_capture())
+                continue
+            auto_waits = 0
+            prev_hash = cur_hash
+
+            plan = await self.plan_next_step(goal, frame, i)
             print(f"Brain: {plan.get('analysis', '...')}")
             
             action = plan.get('action', {})
@@ -242,8 +531,22 @@ class NeuroOrchestrator:
             
             # Act Direct
             await self.execute_action_direct(action)
-            
-            self.history.append({"action": action})
-            time.sleep(2) # Stabilize UI
+            last_type = action.get('type')
+
+            self.history.append(self._render_action(action))
+
+            # Pipeline: the stabilize delay + next screenshot start now,
+            # double-buffer style, instead of serially at the loop top
+            next_img_task = asyncio.create_task(self._settle_and_capture())
+
+        # The final iteration scheduled a capture nobody will consume;
+        # reap it so no pending task (and screencap subprocess) outlives
+        # the mission
+        if next_img_task is not None:
+            next_img_task.cancel()
+            try:
+                await next_img_task
+            except asyncio.CancelledError:
+                pass
 
         return {"status": "timeout", "error": "Limit reached"}
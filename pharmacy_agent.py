@@ -1,46 +1,19 @@
-import os
-import json
 import argparse
 import asyncio
-import re
 import sys
 from dotenv import load_dotenv
 
-# --- DroidRun Professional Architecture Imports ---
-try:
-    from droidrun.agent.droid import DroidAgent
-    from droidrun.agent.utils.llm_picker import load_llm
-    from droidrun.config_manager import DroidrunConfig, AgentConfig, ManagerConfig, ExecutorConfig, TelemetryConfig
-except ImportError:
-    print("CRITICAL ERROR: 'droidrun' library not found or incompatible version.")
-    print("Please ensure you have installed it: pip install droidrun")
-    sys.exit(1)
+from comparison_base import AppComparisonAgent
 
 load_dotenv()
 
-class PharmacyAgent:
+class PharmacyAgent(AppComparisonAgent):
     """
     Agent to compare medicine prices across PharmEasy, Apollo 24|7, and Tata 1mg.
-    Follows the Professional Architecture.
+    Shared LLM/config caching, retry and output parsing live on the base.
     """
-    
-    def __init__(self, provider="gemini", model="models/gemini-2.5-flash"):
-        self.provider = provider
-        self.model = model
-        self._ensure_api_keys()
-
-    def _ensure_api_keys(self):
-        if self.provider == "gemini" and not os.getenv("GEMINI_API_KEY") and not os.getenv("GOOGLE_API_KEY"):
-             print("[Warn] GEMINI_API_KEY not found in env, checking GOOGLE_API_KEY")
 
-    def _parse_price(self, price_str):
-        if not price_str: return float('inf')
-        try:
-            clean = str(price_str).lower().replace(',', '').replace('₹', '').replace('rs', '').replace('rs.', '').strip()
-            match = re.search(r'\d+(\.\d+)?', clean)
-            return float(match.group()) if match else float('inf')
-        except:
-            return float('inf')
+    default_model = "models/gemini-2.5-flash"
 
     async def execute_task(self, app_name: str, medicine: str, role: str) -> dict:
         print(f"\n[PharmaAgent] Initializing Task for: {app_name} - {medicine} ({role} mode)")
@@ -68,73 +41,12 @@ class PharmacyAgent:
             f"Ensure strict JSON format."
         )
 
-        # --- Professional Config Setup ---
-        api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-        provider_name = "GoogleGenAI" if self.provider == "gemini" else self.provider
-
-        llm = load_llm(
-            provider_name=provider_name,
-            model=self.model,
-            api_key=api_key
-        )
-
-        manager_config = ManagerConfig(vision=True)
-        executor_config = ExecutorConfig(vision=True)
-        agent_config = AgentConfig(
-            reasoning=True,
-            manager=manager_config,
-            executor=executor_config
-        )
-        telemetry_config = TelemetryConfig(enabled=False)
-        config = DroidrunConfig(
-            agent=agent_config,
-            telemetry=telemetry_config
-        )
-
-        agent = DroidAgent(
-            goal=goal,
-            llms=llm,
-            config=config
-        )
-
         result_data = {"app": app_name, "medicine": medicine, "status": "failed", "data": {}, "numeric_price": float('inf')}
 
         try:
             print(f"[PharmaAgent] 🧠 Running Agent on {app_name} for {medicine}...")
-            result = await agent.run()
-            
-            # --- Robust Output Parsing ---
-            if result:
-                if hasattr(result, 'reason'):
-                     clean_json = str(result.reason).strip()
-                elif hasattr(result, 'message'):
-                     clean_json = str(result.message).strip()
-                else:
-                     clean_json = str(result).strip()
-
-                if "<request_accomplished" in clean_json:
-                    try:
-                        clean_json = clean_json.split(">")[1].split("</request_accomplished>")[0].strip()
-                    except IndexError:
-                        pass
-
-                if "```json" in clean_json:
-                    clean_json = clean_json.split("```json")[1].split("```")[0].strip()
-                elif "```" in clean_json:
-                    clean_json = clean_json.split("```")[1].split("```")[0].strip()
-                
-                if clean_json.startswith("{"):
-                    try:
-                        data = json.loads(clean_json)
-                        result_data["data"] = data
-                        result_data["status"] = "success"
-                        result_data["numeric_price"] = self._parse_price(data.get("price"))
-                    except json.JSONDecodeError:
-                        print(f"[Warn] JSON Decode Error: {clean_json}")
-                else:
-                     print(f"[Warn] Agent output was not JSON: {clean_json[:50]}...")
-            
-            return result_data
+            # Agent construction, retry and output parsing are shared base logic
+            return await self._run_goal(goal, result_data)
 
         except Exception as e:
             print(f"[Error] Task Execution Failed for {app_name}: {e}")
@@ -171,15 +83,14 @@ class PharmacyAgent:
         
         app_totals = {} # {app_name: {total_cost: float, items: [details]}}
 
-        for app in apps:
+        async def check_app(app):
             print(f"\n--- Checking {app} ---")
             total_cost = 0.0
             item_details = []
-            all_found = True
 
             for med in med_list:
                 res = await self.execute_task(app, med['name'], role)
-                
+
                 if res["status"] == "success":
                     price = res["numeric_price"]
                     qty = med['qty']
@@ -194,21 +105,24 @@ class PharmacyAgent:
                     })
                     print(f"  > Found {med['name']} @ {price} x {qty} = {line_total}")
                 else:
+                    # Stop if one item not found, basket incomplete
                     print(f"  > Failed to find {med['name']}")
-                    all_found = False
-                    break # Stop if one item not found, basket incomplete
-                
-                # Small cooldown between searches
+                    print(f"  > Basket incomplete for {app}")
+                    return {"status": "incomplete"}
+
+                # Small cooldown between searches on the same app
                 await asyncio.sleep(2)
 
-            if all_found:
-                app_totals[app] = {"total_cost": total_cost, "items": item_details}
-            else:
-                app_totals[app] = {"status": "incomplete"}
-                print(f"  > Basket incomplete for {app}")
-            
-            # Cooldown betwen apps
-            await asyncio.sleep(3)
+            return {"total_cost": total_cost, "items": item_details}
+
+        # Each app basket is an independent LLM/device-bound session - run
+        # them concurrently instead of serially with an inter-app cooldown
+        baskets = await asyncio.gather(*[check_app(app) for app in apps], return_exceptions=True)
+        for app, basket in zip(apps, baskets):
+            if isinstance(basket, Exception):
+                print(f"[Error] Basket check crashed for {app}: {basket}")
+                basket = {"status": "incomplete"}
+            app_totals[app] = basket
 
         print(f"\n--- Final Aggregated Basket Results ---")
         best_option = None
@@ -1,48 +1,18 @@
-import os
-import json
 import argparse
 import asyncio
-import re
 import sys
 from dotenv import load_dotenv
 
-# --- DroidRun Professional Architecture Imports ---
-try:
-    from droidrun.agent.droid import DroidAgent
-    from droidrun.agent.utils.llm_picker import load_llm
-    from droidrun.config_manager import DroidrunConfig, AgentConfig, ManagerConfig, ExecutorConfig, TelemetryConfig
-except ImportError:
-    print("CRITICAL ERROR: 'droidrun' library not found or incompatible version.")
-    print("Please ensure you have installed it: pip install droidrun")
-    sys.exit(1)
+from comparison_base import AppComparisonAgent
 
 # Load environment variables
 load_dotenv()
 
-class RideComparisonAgent:
+class RideComparisonAgent(AppComparisonAgent):
     """
     Agent to compare ride prices between Uber and Ola using DroidRun.
-    Follows the Professional Architecture.
+    Shared LLM/config caching, retry and output parsing live on the base.
     """
-    
-    def __init__(self, provider="gemini", model="gemini-1.5-flash"):
-        self.provider = provider
-        self.model = model
-        self._ensure_api_keys()
-
-    def _ensure_api_keys(self):
-        if self.provider == "gemini" and not os.getenv("GEMINI_API_KEY") and not os.getenv("GOOGLE_API_KEY"):
-             print("[Warn] GEMINI_API_KEY not found in env, checking GOOGLE_API_KEY")
-
-    def _parse_price(self, price_str):
-        """Robust price parsing utility handling currency symbols."""
-        if not price_str: return float('inf')
-        try:
-            clean = str(price_str).lower().replace(',', '').replace('₹', '').replace('rs', '').replace('rs.', '').strip()
-            match = re.search(r'\d+(\.\d+)?', clean)
-            return float(match.group()) if match else float('inf')
-        except:
-            return float('inf')
 
     async def execute_task(self, app_name: str, pickup: str, drop: str, preference: str = "cab", action: str = "compare") -> dict:
         """
@@ -92,81 +62,12 @@ class RideComparisonAgent:
                 f"Ensure strict JSON format."
             )
 
-        # --- Professional Config Setup ---
-        api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-        
-        # Determine Provider Name for LLM Picker
-        provider_name = "GoogleGenAI" if self.provider == "gemini" else self.provider
-
-        llm = load_llm(
-            provider_name=provider_name,
-            model=self.model,
-            api_key=api_key
-        )
-
-        manager_config = ManagerConfig(vision=True)
-        executor_config = ExecutorConfig(vision=True)
-        
-        agent_config = AgentConfig(
-            reasoning=True,
-            manager=manager_config,
-            executor=executor_config
-        )
-        
-        telemetry_config = TelemetryConfig(enabled=False)
-        
-        config = DroidrunConfig(
-            agent=agent_config,
-            telemetry=telemetry_config
-        )
-
-        agent = DroidAgent(
-            goal=goal,
-            llms=llm,
-            config=config
-        )
-
         result_data = {"app": app_name, "status": "failed", "data": {}, "numeric_price": float('inf')}
 
         try:
             print(f"[RideAgent] 🧠 Running Agent on {app_name}...")
-            result = await agent.run()
-            
-            # --- Robust Output Parsing ---
-            if result:
-                 # Handle DroidAgent Event objects (reasoning field)
-                if hasattr(result, 'reason'):
-                     clean_json = str(result.reason).strip()
-                else:
-                     clean_json = str(result).strip()
-
-                # XML tag cleanup
-                if "<request_accomplished" in clean_json:
-                    try:
-                        clean_json = clean_json.split(">")[1].split("</request_accomplished>")[0].strip()
-                    except IndexError:
-                        pass
-                
-                # Markdown cleanup
-                if "```json" in clean_json:
-                    clean_json = clean_json.split("```json")[1].split("```")[0].strip()
-                elif "```" in clean_json:
-                    clean_json = clean_json.split("```")[1].split("```")[0].strip()
-                
-                if clean_json.startswith("{"):
-                    try:
-                        data = json.loads(clean_json)
-                        result_data["data"] = data
-                        result_data["status"] = "success"
-                        # Extract numeric price for comparison
-                        price_val = data.get("price", "inf")
-                        result_data["numeric_price"] = self._parse_price(price_val)
-                    except json.JSONDecodeError:
-                        print(f"[Warn] JSON Decode Error: {clean_json}")
-                else:
-                     print(f"[Warn] Agent output was not JSON: {clean_json[:50]}...")
-            
-            return result_data
+            # Agent construction, retry and output parsing are shared base logic
+            return await self._run_goal(goal, result_data)
 
         except Exception as e:
             print(f"[Error] Task Execution Failed for {app_name}: {e}")
@@ -174,13 +75,20 @@ class RideComparisonAgent:
 
     async def compare_rides(self, pickup, drop, preference="cab"):
         apps = ["Uber", "Ola"]
-        results = {}
 
-        for app in apps:
-            res = await self.execute_task(app, pickup, drop, preference, action="compare")
+        # Both ride checks are independent agent sessions - overlap them
+        # instead of running serially with an app-switch cooldown
+        done = await asyncio.gather(
+            *[self.execute_task(app, pickup, drop, preference, action="compare") for app in apps],
+            return_exceptions=True
+        )
+
+        results = {}
+        for app, res in zip(apps, done):
+            if isinstance(res, Exception):
+                print(f"[Error] Ride check crashed on {app}: {res}")
+                res = {"app": app, "status": "failed", "data": {}, "numeric_price": float('inf')}
             results[app] = res
-            # Cooldown to allow app switching/closing
-            await asyncio.sleep(3)
 
         # Comparison Logic
         print("\n--- Final Aggregated Results ---")
@@ -1,12 +1,18 @@
 import asyncio
 import json
 import logging
+import os
+import sys
+import time
 import uuid
-from datetime import datetime
-from typing import Dict, Any, List, Optional
+from collections import defaultdict, deque
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import orjson
+from typing import Dict, Any, Optional
+
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 # Import Agents
@@ -25,80 +31,180 @@ from schemas import FullTripPlan
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("DroidServer")
 
-app = FastAPI()
-
-# CORS
+# REST responses render through orjson - same fast encoder the
+# WebSocket broadcasts already use
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# CORS - explicit origins/methods/headers take the fast path through
+# CORSMiddleware instead of the wildcard logic on every request, and
+# max_age lets browsers cache preflights for a day. Override origins
+# via ALLOWED_ORIGINS (comma-separated) for non-local deployments.
+_origins = os.environ.get(
+    "ALLOWED_ORIGINS",
+    # 8081 is the documented `python -m http.server 8081` dashboard host
+    "http://localhost:8081,http://127.0.0.1:8081,"
+    "http://localhost:8000,http://127.0.0.1:8000,http://localhost:3000"
+).split(",")
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=_origins,
+    allow_credentials=False,
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type"],
+    max_age=86400,
 )
 
+def _iso() -> str:
+    """ISO-8601 local timestamp via time.strftime - no datetime allocation."""
+    now = time.time()
+    return "%s.%06d" % (time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)), int(now % 1 * 1e6))
+
 # --- InMemory Task Store ---
 # Structure: { task_id: { "id": str, "persona": str, "status": str, "logs": list, "result": Any, "timestamp": str } }
-task_history: List[Dict[str, Any]] = []
+# Bounded deque: appendleft is O(1) (list.insert(0) shifted every element)
+# and the cap keeps a long-running server from growing without limit
+MAX_TASK_HISTORY = 1000
+task_history: deque = deque(maxlen=MAX_TASK_HISTORY)
+# Id -> record index sharing the same dicts; log appends and status
+# updates run on the hot WebSocket path, so lookups must be O(1)
+# instead of a scan over the whole history
+task_index: Dict[str, Dict[str, Any]] = {}
 
 def add_task_record(task_id: str, persona: str, payload: Any):
     record = {
         "id": task_id,
         "persona": persona,
         "status": "running",
-        "created_at": datetime.now().isoformat(),
+        "created_at": _iso(),
         "logs": [],
         "result": None,
-        "payload": payload.dict()
+        # Stored as the model itself - no dict materialization on the
+        # submit path; FastAPI's response encoder unwraps it lazily when
+        # /tasks or /tasks/{id} is actually queried
+        "payload": payload
     }
-    task_history.insert(0, record) # Newest first
+    # Evict the oldest record from the index before the deque drops it
+    if len(task_history) == MAX_TASK_HISTORY:
+        task_index.pop(task_history[-1]["id"], None)
+    task_history.appendleft(record) # Newest first
+    task_index[task_id] = record
     return record
 
 def update_task_status(task_id: str, status: str, result: Any = None):
-    for task in task_history:
-        if task["id"] == task_id:
-            task["status"] = status
-            if result:
-                task["result"] = result
-            break
+    task = task_index.get(task_id)
+    if task:
+        task["status"] = status
+        if result:
+            task["result"] = result
+
+# The log timestamp has 1-second resolution, so the formatted string is
+# memoized per second instead of paying a fresh strftime per line
+_last_log_sec = 0
+_last_log_hms = ""
 
 def append_task_log(task_id: str, message: str):
-    for task in task_history:
-        if task["id"] == task_id:
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            log_entry = f"[{timestamp}] {message}"
-            task["logs"].append(log_entry)
-            break
+    global _last_log_sec, _last_log_hms
+    task = task_index.get(task_id)
+    if task:
+        now = int(time.time())
+        if now != _last_log_sec:
+            _last_log_sec = now
+            _last_log_hms = time.strftime("%H:%M:%S", time.localtime(now))
+        task["logs"].append(f"[{_last_log_hms}] {message}")
 
 # WebSocket Manager
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
+        # Set: O(1) disconnect, and discard below tolerates double removal
+        # (endpoint teardown can race broadcast pruning)
+        self.active_connections: set[WebSocket] = set()
+        # Per-task routing: subs maps task_id -> subscribed sockets and
+        # ws_subs is the reverse map for O(1) cleanup on disconnect.
+        # Sockets that never subscribe (the stock dashboard) stay in
+        # firehose mode and receive everything.
+        self.subs: Dict[str, set] = defaultdict(set)
+        self.ws_subs: Dict[WebSocket, set] = {}
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
+        self.ws_subs[websocket] = set()
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        self.active_connections.discard(websocket)
+        for task_id in self.ws_subs.pop(websocket, ()):
+            self.subs[task_id].discard(websocket)
+            if not self.subs[task_id]:
+                del self.subs[task_id]
+
+    def subscribe(self, websocket: WebSocket, task_id: str):
+        self.subs[task_id].add(websocket)
+        self.ws_subs.setdefault(websocket, set()).add(task_id)
+
+    def unsubscribe(self, websocket: WebSocket, task_id: str):
+        self.subs[task_id].discard(websocket)
+        if not self.subs[task_id]:
+            del self.subs[task_id]
+        self.ws_subs.get(websocket, set()).discard(task_id)
+
+    def _targets(self, task_id: Optional[str]):
+        """Connections a frame should reach: everyone for global frames,
+        subscribers plus firehose clients for task-scoped ones."""
+        if task_id is None:
+            return list(self.active_connections)
+        subbed = self.subs.get(task_id, ())
+        return [
+            ws for ws in self.active_connections
+            if ws in subbed or not self.ws_subs.get(ws)
+        ]
 
     async def broadcast(self, message: str):
         # Legacy support if needed, but we prefer structured
-        for connection in self.active_connections:
+        for connection in tuple(self.active_connections):
             try:
                 await connection.send_text(message)
             except:
                 pass
 
-    async def broadcast_json(self, data: Dict[str, Any]):
-        message = json.dumps(data, default=str)
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                pass
+    async def broadcast_json(self, data: Dict[str, Any], task_id: Optional[str] = None):
+        # Nobody listening (curl/dev workflows): skip the encode entirely
+        if not self.active_connections:
+            return
+        # orjson emits bytes and handles datetimes natively; sending binary
+        # frames skips a UTF-8 decode/encode round-trip per connection
+        message = orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+        # Serialize once, fan out concurrently: one slow/backpressured
+        # client no longer stalls delivery to everyone else. Snapshot the
+        # list so connects/disconnects during the await are safe.
+        conns = self._targets(task_id)
+        if not conns:
+            return
+        results = await asyncio.gather(
+            *(c.send_bytes(message) for c in conns),
+            return_exceptions=True,
+        )
+        for conn, res in zip(conns, results):
+            if isinstance(res, Exception):
+                logger.info(f"Dropping dead WebSocket client: {res}")
+                self.disconnect(conn)
+
+    async def _heartbeat(self, interval: float = 30.0):
+        """Periodic ping so silently-dropped clients (no TCP FIN ever
+        arrives) fail a send and get pruned instead of lingering in the
+        registry and being retried on every broadcast."""
+        while True:
+            await asyncio.sleep(interval)
+            if self.active_connections:
+                await self.broadcast_json({"type": "ping"})
 
 manager = ConnectionManager()
 
+# Frame-type strings used on every broadcast, interned once so the hot
+# envelope dicts hash and encode shared objects instead of fresh strings
+_TYPE_START = sys.intern("start")
+_TYPE_COMPLETE = sys.intern("complete")
+_TYPE_LOG_BATCH = sys.intern("log_batch")
+
 # Data Models
 class TaskPayload(BaseModel):
     persona: str
@@ -126,35 +232,76 @@ class TaskPayload(BaseModel):
 async def root():
     return {"status": "DroidRun Server Running"}
 
+def _public_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Shallow-copy a record for responses, dumping the payload compactly.
+
+    exclude_none/exclude_defaults drops the half-dozen fields the persona
+    never filled in, roughly halving the serialized record size.
+    """
+    rec = dict(record)
+    rec["payload"] = record["payload"].model_dump(exclude_none=True, exclude_defaults=True)
+    return rec
+
 @app.get("/tasks")
 async def get_tasks():
-    return task_history
+    return [_public_record(task) for task in task_history]
 
 @app.get("/tasks/{task_id}")
 async def get_task_details(task_id: str):
-    for task in task_history:
-        if task["id"] == task_id:
-            return task
-    return {"error": "Task not found"}
+    task = task_index.get(task_id)
+    return _public_record(task) if task else {"error": "Task not found"}
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
-            await websocket.receive_text()
-            # Keep alive
+            raw = await websocket.receive_text()
+            # Optional routing control: {"subscribe": task_id} narrows this
+            # socket to specific tasks; anything else keeps it alive
+            try:
+                msg = json.loads(raw)
+            except ValueError:
+                continue
+            if isinstance(msg, dict):
+                if msg.get("subscribe"):
+                    manager.subscribe(websocket, msg["subscribe"])
+                elif msg.get("unsubscribe"):
+                    manager.unsubscribe(websocket, msg["unsubscribe"])
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
+# Log lines are coalesced over a short window before broadcast: a noisy
+# agent produces dozens of tiny frames per second, and batching amortizes
+# the JSON encode + per-connection send across all lines in the window.
+LOG_BATCH_WINDOW = 0.03
+log_queue: asyncio.Queue = asyncio.Queue()
+
+async def _log_batcher():
+    while True:
+        item = await log_queue.get()
+        batch = [item]
+        await asyncio.sleep(LOG_BATCH_WINDOW)
+        while not log_queue.empty():
+            batch.append(log_queue.get_nowait())
+        # Group by task so each frame routes only to that task's
+        # subscribers (plus firehose clients)
+        by_task = defaultdict(list)
+        for entry in batch:
+            by_task[entry["task_id"]].append(entry)
+        for tid, items in by_task.items():
+            await manager.broadcast_json({
+                "type": _TYPE_LOG_BATCH,
+                "items": items
+            }, task_id=tid)
+
 async def log_and_broadcast(task_id: str, message: str):
-    """Save log to history and broadcast to WS"""
+    """Save log to history and queue it for the batched WS broadcast"""
     append_task_log(task_id, message)
-    await manager.broadcast_json({
-        "type": "log",
-        "task_id": task_id,
-        "message": message
-    })
+    # History always records; the frame dict and batcher wakeup are only
+    # worth paying when a dashboard is actually attached
+    if manager.active_connections:
+        log_queue.put_nowait({"task_id": task_id, "message": message})
 
 async def run_agent_task(payload: TaskPayload):
     """
@@ -163,14 +310,19 @@ async def run_agent_task(payload: TaskPayload):
     """
     task_id = str(uuid.uuid4())
     add_task_record(task_id, payload.persona, payload)
-    
-    # Notify start
-    await manager.broadcast_json({
-        "type": "start",
+
+    # One envelope serves both lifecycle frames for this task; only the
+    # varying fields are assigned per broadcast. Safe because
+    # broadcast_json serializes before its first await.
+    envelope = {
+        "type": _TYPE_START,
         "task_id": task_id,
         "persona": payload.persona,
-        "timestamp": datetime.now().isoformat()
-    })
+        "timestamp": _iso()
+    }
+
+    # Notify start
+    await manager.broadcast_json(envelope)
 
     await log_and_broadcast(task_id, f"🚀 Starting Executor for Persona: {payload.persona}")
     
@@ -179,7 +331,7 @@ async def run_agent_task(payload: TaskPayload):
     
     try:
         if payload.persona == "shopper":
-            agent = CommerceAgent(model="models/gemini-2.5-flash")
+            agent = app.state.agents["shopper"]
             await log_and_broadcast(task_id, f"Searching for {payload.product} on Amazon/Flipkart...")
             
             result = await agent.execute_task("Amazon", payload.product, "product") 
@@ -189,7 +341,7 @@ async def run_agent_task(payload: TaskPayload):
                  result = await agent.execute_task("Flipkart", payload.product, "product")
                  
         elif payload.persona == "rider":
-            agent = RideComparisonAgent(model="models/gemini-2.5-flash")
+            agent = app.state.agents["rider"]
             pref_msg = f" ({payload.preference.upper()})" if payload.preference else ""
             
             await log_and_broadcast(task_id, f"Vehicle Preference: {payload.preference or 'Any'}")
@@ -250,13 +402,13 @@ async def run_agent_task(payload: TaskPayload):
                 await log_and_broadcast(task_id, msg)
             
         elif payload.persona == "patient":
-            agent = PharmacyAgent(model="models/gemini-2.5-flash")
+            agent = app.state.agents["patient"]
             await log_and_broadcast(task_id, f"Searching for medicine: {payload.medicine}...")
             full_res = await agent.compare_prices(payload.medicine, "patient")
             result = full_res.get('best_option', {"status": "failed"})
 
         elif payload.persona == "foodie":
-             agent = CommerceAgent(model="models/gemini-2.5-flash")
+             agent = app.state.agents["foodie"]
              await log_and_broadcast(task_id, f"🍔 Foodie Mode Activated: {payload.action.upper()} '{payload.food_item}'")
              
              if payload.action == 'order':
@@ -277,24 +429,36 @@ async def run_agent_task(payload: TaskPayload):
 
              else:
                  await log_and_broadcast(task_id, "Searching Zomato and Swiggy...")
-                 results = {}
+                 # Both platform searches are independent agent sessions -
+                 # overlap them instead of serially with a cooldown between
                  platforms = ["Zomato", "Swiggy"]
-                 for p in platforms:
-                      await log_and_broadcast(task_id, f"Checking {p}...")
-                      res = await agent.execute_task(p, payload.food_item, "food item", action="search")
+                 done = await asyncio.gather(
+                     *[agent.execute_task(p, payload.food_item, "food item", action="search") for p in platforms],
+                     return_exceptions=True
+                 )
+                 results = {}
+                 for p, res in zip(platforms, done):
+                      if isinstance(res, Exception):
+                           await log_and_broadcast(task_id, f"⚠️ {p} check failed: {res}")
+                           res = {"platform": p, "status": "failed", "data": {}}
                       results[p.lower()] = res
-                      await asyncio.sleep(1)
                  
                  z_price = results.get('zomato', {}).get('data', {}).get('price', 'N/A')
                  s_price = results.get('swiggy', {}).get('data', {}).get('price', 'N/A')
-                 
-                 zp = float(results.get('zomato', {}).get('data', {}).get('numeric_price', float('inf')))
-                 sp = float(results.get('swiggy', {}).get('data', {}).get('numeric_price', float('inf')))
-                 
-                 winner = "None"
-                 if zp < sp: winner = "Zomato"
-                 elif sp < zp: winner = "Swiggy"
-                 elif zp == sp and zp != float('inf'): winner = "Tie"
+
+                 # One min() pass over (price, platform) candidates - extends
+                 # to any number of platforms without another branch chain
+                 inf = float('inf')
+                 cands = [
+                     (float(results.get(p.lower(), {}).get('data', {}).get('numeric_price', inf)), p)
+                     for p in platforms
+                 ]
+                 if all(price == inf for price, _ in cands):
+                     winner = "None"
+                 else:
+                     best_price = min(price for price, _ in cands)
+                     tied = [name for price, name in cands if price == best_price]
+                     winner = "Tie" if len(tied) > 1 else tied[0]
 
                  await log_and_broadcast(task_id, f"Prices found: Zomato ({z_price}), Swiggy ({s_price})")
                  result = {
@@ -304,7 +468,7 @@ async def run_agent_task(payload: TaskPayload):
                  }
 
         elif payload.persona == "coordinator":
-            agent = EventCoordinatorAgent(model="models/gemini-2.5-flash")
+            agent = app.state.agents["coordinator"]
             await log_and_broadcast(task_id, f"🎪 Orchestrating Event: {payload.event_name}")
             logistics = [] 
             await agent.orchestrate_event(payload.event_name, payload.guest_list, logistics)
@@ -313,8 +477,8 @@ async def run_agent_task(payload: TaskPayload):
         elif payload.persona == "traveller":
             await log_and_broadcast(task_id, f"✈️ Starting Voyager-1: Trip to {payload.destination}...")
             
-            transit_agent = TransitManager()
-            stay_agent = StayManager()
+            transit_agent = app.state.transit_agent
+            stay_agent = app.state.stay_agent
             
             # 1. Flight
             await log_and_broadcast(task_id, f"Searching flights from {payload.source} to {payload.destination}...")
@@ -369,19 +533,72 @@ async def run_agent_task(payload: TaskPayload):
 
     # Update History and Broadcast Completion
     update_task_status(task_id, status, result)
-    await manager.broadcast_json({
-        "type": "complete",
-        "task_id": task_id,
-        "status": status,
-        "result": result
-    })
+    envelope["type"] = _TYPE_COMPLETE
+    envelope["status"] = status
+    envelope["result"] = result
+    envelope["timestamp"] = _iso()
+    await manager.broadcast_json(envelope)
+
+# --- Worker Pool ---
+# Agent runs go through a bounded queue drained by N workers instead of
+# an unbounded asyncio.create_task per request: concurrency is capped,
+# a full queue gives callers backpressure, and the request loop stays
+# responsive for WebSocket traffic. The worker count doubles as the
+# semaphore on in-flight agents - tune per deployment via env.
+WORKER_COUNT = int(os.environ.get("MAX_CONCURRENT_AGENTS", "3"))
+TASK_QUEUE_SIZE = 100
+task_queue: asyncio.Queue = asyncio.Queue(maxsize=TASK_QUEUE_SIZE)
+
+async def _task_worker(worker_id: int):
+    while True:
+        payload = await task_queue.get()
+        try:
+            await run_agent_task(payload)
+        except Exception as e:
+            logger.error(f"Worker {worker_id} task crashed: {e}")
+        finally:
+            task_queue.task_done()
+
+@app.on_event("startup")
+async def start_workers():
+    # Agent singletons: constructors build LLM clients and configs, which
+    # is pure overhead when paid per request. The foodie persona shares
+    # the shopper's CommerceAgent; the traveller managers are stateless
+    # wrappers around their own clients and are reused the same way.
+    shopper = CommerceAgent(model="models/gemini-2.5-flash")
+    app.state.agents = {
+        "shopper": shopper,
+        "foodie": shopper,
+        "rider": RideComparisonAgent(model="models/gemini-2.5-flash"),
+        "patient": PharmacyAgent(model="models/gemini-2.5-flash"),
+        "coordinator": EventCoordinatorAgent(model="models/gemini-2.5-flash"),
+    }
+    app.state.transit_agent = TransitManager()
+    app.state.stay_agent = StayManager()
+    app.state.workers = [
+        asyncio.create_task(_task_worker(i)) for i in range(WORKER_COUNT)
+    ]
+    app.state.log_batcher = asyncio.create_task(_log_batcher())
+    app.state.heartbeat = asyncio.create_task(manager._heartbeat())
 
 @app.post("/task")
 async def create_task(payload: TaskPayload):
-    # Run in background
-    asyncio.create_task(run_agent_task(payload))
+    try:
+        task_queue.put_nowait(payload)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Task queue full, try again later")
     return {"status": "accepted", "message": "Task queued"}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop (Cython event loop) roughly doubles asyncio throughput, which
+    # benefits both /task fan-in and the WebSocket broadcast fan-out; it is
+    # Linux/macOS only, so Windows keeps the default loop.
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop" if sys.platform != "win32" else "asyncio",
+        http="httptools" if sys.platform != "win32" else "auto",
+        ws="websockets",
+    )